@@ -8,16 +8,28 @@ import google.generativeai as genai
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from search_engine import SearchEngine
+from components.cache import GeminiCache
 
-# Configure Gemini API
 GEMINI_API_KEY = "YOUR_GEMINI_API_KEY"
-genai.configure(api_key=GEMINI_API_KEY)
+
+# Results per search page; /api/answer must use the same page so its cached
+# answer is the one the search page looks up
+RESULTS_PER_PAGE = 10
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-here'
 
-# Initialize search engine
-search_engine = SearchEngine(data_dir=os.path.join(os.path.dirname(__file__), 'data'))
+# Page parsing worker processes re-run this script as __mp_main__; only the
+# app process itself sets up the search engine and the Gemini client
+if __name__ != '__mp_main__':
+    # Configure Gemini API
+    genai.configure(api_key=GEMINI_API_KEY)
+    
+    # Initialize search engine
+    search_engine = SearchEngine(data_dir=os.path.join(os.path.dirname(__file__), 'data'))
+    
+    # Cache Gemini answers so repeated queries skip the API round-trip
+    gemini_cache = GeminiCache(os.path.join(search_engine.data_dir, 'gemini_cache.db'))
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -36,13 +48,19 @@ def index():
 def get_gemini_answer(query, search_results):
     """Get AI-generated answer from Gemini"""
     try:
+        cache_key = gemini_cache.make_key(query, search_results)
+        cached_answer = gemini_cache.get(cache_key)
+        if cached_answer is not None:
+            return cached_answer
+        
         model = genai.GenerativeModel('gemini-2.5-flash')
         
         # Create context from search results
-        context = ""
+        context_parts = []
         for i, result in enumerate(search_results[:3], 1):
             snippet = result.get('meta_description') or result.get('content', '')[:300]
-            context += f"\n[Source {i}]: {snippet}\n"
+            context_parts.append(f"\n[Source {i}]: {snippet}\n")
+        context = "".join(context_parts)
         
         # Create prompt
         prompt = f"""Based on the search query and the following search results, provide a comprehensive and accurate answer to the user's question. Be concise but informative.
@@ -54,6 +72,7 @@ Search Results Context:{context}
 Please provide a helpful answer based on the available information. If the search results don't contain relevant information, provide a general answer based on your knowledge and mention that specific sources weren't found."""
         
         response = model.generate_content(prompt)
+        gemini_cache.set(cache_key, response.text)
         return response.text
     except Exception as e:
         logger.error(f"Error getting Gemini answer: {str(e)}")
@@ -64,27 +83,25 @@ def search():
     """Handle search requests"""
     query = request.args.get('q', '').strip()
     page = int(request.args.get('page', 1))
-    per_page = 10
+    per_page = RESULTS_PER_PAGE
     
     if not query:
         return redirect(url_for('index'))
     
-    # Calculate offset for pagination
-    offset = (page - 1) * per_page
+    # Perform search for the requested page only
+    results_page = search_engine.search_page(query, page, per_page)
+    page_results = results_page['results']
     
-    # Perform search
-    results = search_engine.search(query, limit=per_page * page)
-    
-    # Get results for current page
-    page_results = results[offset:offset + per_page]
-    
-    # Get AI answer from Gemini (only for first page)
+    # Show a cached AI answer straight away (only for first page); otherwise the
+    # page loads it from /api/answer so rendering doesn't wait on Gemini
     ai_answer = None
-    if page == 1 and results:
-        ai_answer = get_gemini_answer(query, results)
+    load_ai_answer = False
+    if page == 1 and page_results:
+        ai_answer = gemini_cache.get(gemini_cache.make_key(query, page_results))
+        load_ai_answer = ai_answer is None
     
     # Check if there are more results
-    has_next = len(results) > offset + per_page
+    has_next = results_page['page'] < results_page['page_count']
     has_prev = page > 1
     
     return render_template('search_results.html',
@@ -93,8 +110,9 @@ def search():
                          page=page,
                          has_next=has_next,
                          has_prev=has_prev,
-                         total_results=len(results),
-                         ai_answer=ai_answer)
+                         total_results=results_page['total'],
+                         ai_answer=ai_answer,
+                         load_ai_answer=load_ai_answer)
 
 @app.route('/api/search')
 def api_search():
@@ -113,6 +131,20 @@ def api_search():
         'total': len(results)
     })
 
+@app.route('/api/answer')
+def api_answer():
+    """API endpoint for the AI-generated answer to a query"""
+    query = request.args.get('q', '').strip()
+    
+    if not query:
+        return jsonify({'error': 'Query parameter is required'}), 400
+    
+    # Use the same first-page results the search page shows as context
+    results = search_engine.search_page(query, 1, RESULTS_PER_PAGE)['results']
+    answer = get_gemini_answer(query, results) if results else None
+    
+    return jsonify({'query': query, 'answer': answer})
+
 @app.route('/api/suggestions')
 def api_suggestions():
     """API endpoint for query suggestions"""
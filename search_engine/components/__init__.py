@@ -5,6 +5,8 @@ from .indexer import SearchIndexer
 from .query_engine import QueryEngine
 from .scheduler import CrawlScheduler
 from .ranking import SearchRanking
+from .crawl_cache import CrawlCache
+from .cache import TTLCache, GeminiCache
 
 __all__ = [
     'WebCrawler',
@@ -12,5 +14,8 @@ __all__ = [
     'SearchIndexer',
     'QueryEngine',
     'CrawlScheduler',
-    'SearchRanking'
+    'SearchRanking',
+    'CrawlCache',
+    'TTLCache',
+    'GeminiCache'
 ]
@@ -0,0 +1,99 @@
+import time
+import json
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Seconds between sweeps of expired rows from the Gemini answer cache
+GEMINI_PURGE_INTERVAL = 3600
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries expire after a fixed time"""
+
+    def __init__(self, maxsize=1024, ttl=300):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        """Return the cached value for key, or default if missing or expired"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return default
+
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._entries[key]
+                return default
+
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """Cache a value, evicting the least recently used entry when full"""
+        with self._lock:
+            self._entries[key] = (value, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        """Drop all cached entries"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class GeminiCache:
+    """SQLite-backed cache of Gemini answers keyed by query and top sources"""
+
+    def __init__(self, db_path, ttl=24 * 3600):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._last_purge = 0
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS answers (key TEXT PRIMARY KEY, answer TEXT, ts REAL)"
+        )
+        self.conn.commit()
+        self.purge_expired()
+
+    def make_key(self, query, search_results):
+        """Build the cache key from the query and the URLs used as context"""
+        urls = [result.get('url', '') for result in search_results[:3]]
+        return hashlib.sha256(json.dumps([query, urls]).encode()).hexdigest()
+
+    def get(self, key):
+        """Return a cached answer that is younger than the TTL, or None"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT answer FROM answers WHERE key = ? AND ts > ?",
+                (key, time.time() - self.ttl)
+            ).fetchone()
+        return row[0] if row else None
+
+    def set(self, key, answer):
+        """Store an answer, sweeping out expired ones at most once per purge interval"""
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.execute(
+                "INSERT OR REPLACE INTO answers (key, answer, ts) VALUES (?, ?, ?)",
+                (key, answer, now)
+            )
+
+        if now - self._last_purge >= GEMINI_PURGE_INTERVAL:
+            self.purge_expired()
+
+    def purge_expired(self):
+        """Delete answers older than the TTL so the database doesn't grow forever"""
+        now = time.time()
+        with self._lock, self.conn:
+            self.conn.execute("DELETE FROM answers WHERE ts <= ?", (now - self.ttl,))
+            self._last_purge = now
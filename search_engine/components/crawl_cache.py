@@ -0,0 +1,99 @@
+import sqlite3
+import threading
+import hashlib
+import json
+import logging
+
+# BLAKE3 is SIMD-accelerated and much faster than SHA-1 on page-sized input;
+# stdlib BLAKE2b is the fallback when the blake3 package isn't installed
+try:
+    import blake3
+except ImportError:
+    blake3 = None
+
+HASH_BYTES = 16
+
+def content_hash(text):
+    """Hash page content for change detection"""
+    data = text.encode('utf-8', errors='replace')
+    if blake3 is not None:
+        return blake3.blake3(data).digest(HASH_BYTES)
+    return hashlib.blake2b(data, digest_size=HASH_BYTES).digest()
+
+class CrawlCache:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self.logger = logging.getLogger(__name__)
+        self._lock = threading.Lock()
+        self._pending = []
+
+        # The crawler looks pages up from several worker threads
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS pages (
+                url TEXT PRIMARY KEY,
+                etag TEXT,
+                last_modified TEXT,
+                content_hash BLOB,
+                links TEXT,
+                crawl_time REAL
+            )
+        """)
+        self.conn.commit()
+
+    def get(self, url):
+        """Get the cached crawl record for a URL, or None if it was never crawled"""
+        with self._lock:
+            row = self.conn.execute(
+                "SELECT etag, last_modified, content_hash, links, crawl_time FROM pages WHERE url = ?",
+                (url,)
+            ).fetchone()
+
+        if row is None:
+            return None
+
+        return {
+            'etag': row[0],
+            'last_modified': row[1],
+            'content_hash': row[2],
+            'links': json.loads(row[3]) if row[3] else [],
+            'crawl_time': row[4]
+        }
+
+    def record(self, url, etag, last_modified, content_hash, links, crawl_time):
+        """Queue a crawl record; it is written on the next flush()"""
+        with self._lock:
+            self._pending.append(
+                (url, etag, last_modified, content_hash, json.dumps(links), crawl_time)
+            )
+
+    def discard_pending(self):
+        """Drop records queued since the last flush"""
+        with self._lock:
+            self._pending = []
+
+    def flush(self):
+        """Write all queued records in a single transaction"""
+        with self._lock:
+            if not self._pending:
+                return
+
+            try:
+                with self.conn:
+                    self.conn.executemany(
+                        "INSERT OR REPLACE INTO pages "
+                        "(url, etag, last_modified, content_hash, links, crawl_time) "
+                        "VALUES (?, ?, ?, ?, ?, ?)",
+                        self._pending
+                    )
+                self.logger.info(f"Saved {len(self._pending)} pages to the crawl cache")
+                self._pending = []
+            except Exception as e:
+                self.logger.error(f"Error saving crawl cache: {e}")
+
+    def close(self):
+        """Close the cache database"""
+        with self._lock:
+            self.conn.close()
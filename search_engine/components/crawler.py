@@ -1,24 +1,76 @@
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
 import urllib.parse
 from urllib.robotparser import RobotFileParser
-from collections import deque
+from collections import deque, defaultdict
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 import threading
 import logging
+from .crawl_cache import CrawlCache, content_hash
+from .parser import WebParser
+
+# Pages larger than this are skipped (or truncated when no length is sent)
+MAX_PAGE_BYTES = 5 * 1024 * 1024
 
 class WebCrawler:
-    def __init__(self, max_pages=100, delay=1, max_depth=3):
+    def __init__(self, max_pages=100, delay=1, max_depth=3, max_workers=32, cache_file=None,
+                 parser=None):
         self.max_pages = max_pages
         self.delay = delay
         self.max_depth = max_depth
+        self.max_workers = max_workers
         self.visited_urls = set()
         self.url_queue = deque()
+        self.queued_urls = set()
+        
+        # URLs turned away by robots.txt or that failed to fetch; never queued again
+        self.rejected_urls = set()
         self.crawled_pages = []
+        self.unchanged_pages = []
+        
+        # Searcher on the search index; pages missing from it are never skipped as unchanged
+        self.index_searcher = None
+        self._index_lock = threading.Lock()
+        
+        # Set by stop() to end a crawl early, e.g. on shutdown
+        self.stopped = False
+        
+        # Worker processes that parse pages during crawl(), if the crawl is big enough
+        self._parse_pool = None
+        
+        # Pages are parsed as they are crawled; the same parse yields both the
+        # indexable fields and the links to follow
+        self.parser = parser or WebParser()
+        
+        # Validators from earlier crawls, used to skip pages that haven't changed
+        self.crawl_cache = CrawlCache(cache_file) if cache_file else None
+        
+        # Shared state is touched from worker threads during crawl()
+        self._lock = threading.Lock()
+        self._host_last_fetch = {}
+        
+        # robots.txt parsers keyed by scheme://netloc, fetched once per host
+        self._robots_cache = {}
+        self._robots_lock = threading.Lock()
+        
         self.session = requests.Session()
         self.session.headers.update({
             'User-Agent': '168.se Bot 1.0'
         })
         
+        # Keep a connection pool per host for every worker so keep-alive
+        # connections are reused instead of re-handshaking each request
+        adapter = HTTPAdapter(
+            pool_connections=max_workers,
+            pool_maxsize=max_workers,
+            max_retries=Retry(total=2, backoff_factor=0.3)
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        
         # Setup logging
         logging.basicConfig(level=logging.INFO)
         self.logger = logging.getLogger(__name__)
@@ -27,103 +79,273 @@ class WebCrawler:
         """Check robots.txt to see if we can crawl this URL"""
         try:
             parsed_url = urllib.parse.urlparse(url)
-            robots_url = f"{parsed_url.scheme}://{parsed_url.netloc}/robots.txt"
+            host = f"{parsed_url.scheme}://{parsed_url.netloc}"
+            
+            with self._robots_lock:
+                rp = self._robots_cache.get(host)
             
-            rp = RobotFileParser()
-            rp.set_url(robots_url)
-            rp.read()
+            if rp is None:
+                rp = RobotFileParser()
+                rp.set_url(f"{host}/robots.txt")
+                try:
+                    rp.read()
+                except Exception:
+                    # If we can't check robots.txt, assume we can crawl and
+                    # don't retry the broken endpoint on every URL
+                    rp.allow_all = True
+                
+                with self._robots_lock:
+                    rp = self._robots_cache.setdefault(host, rp)
             
             return rp.can_fetch('*', url)
         except:
             return True  # If we can't check robots.txt, assume we can crawl
     
+    def get_host(self, url):
+        """Return the host part of a URL, used to group politeness delays"""
+        return urllib.parse.urlparse(url).netloc.lower()
+    
     def normalize_url(self, url, base_url):
         """Normalize and resolve relative URLs"""
         return urllib.parse.urljoin(base_url, url)
     
-    def extract_links(self, content, base_url):
-        """Extract links from HTML content"""
-        from bs4 import BeautifulSoup
+    def fetch_html(self, url, cached=None):
+        """Download an HTML page, skipping non-HTML or oversized responses
         
-        links = []
-        try:
-            soup = BeautifulSoup(content, 'html.parser')
-            for link in soup.find_all('a', href=True):
-                href = link['href']
-                normalized_url = self.normalize_url(href, base_url)
-                
-                # Only include HTTP/HTTPS links
-                if normalized_url.startswith(('http://', 'https://')):
-                    links.append(normalized_url)
-        except Exception as e:
-            self.logger.error(f"Error extracting links from {base_url}: {e}")
+        Returns (content, response_headers), with content set to None when the
+        cached copy is still current, or None if the page should be skipped.
+        """
+        # Ask the server to only send the page if it changed since the last crawl
+        headers = {}
+        if cached:
+            if cached['etag']:
+                headers['If-None-Match'] = cached['etag']
+            if cached['last_modified']:
+                headers['If-Modified-Since'] = cached['last_modified']
         
-        return links
+        # Stream the body so headers can be checked before anything is downloaded
+        with self.session.get(url, timeout=10, stream=True, headers=headers) as response:
+            if response.status_code == 304 and cached:
+                return None, response.headers
+            
+            response.raise_for_status()
+            
+            # Only process HTML content
+            content_type = response.headers.get('content-type', '').lower()
+            if 'text/html' not in content_type:
+                return None
+            
+            content_length = response.headers.get('content-length')
+            if content_length and content_length.isdigit() and int(content_length) > MAX_PAGE_BYTES:
+                self.logger.info(f"Skipping oversized page ({content_length} bytes): {url}")
+                return None
+            
+            body = response.raw.read(MAX_PAGE_BYTES, decode_content=True)
+            return body.decode(response.encoding or 'utf-8', errors='replace'), response.headers
+    
+    def page_count(self):
+        """Number of pages handled so far, changed or not"""
+        return len(self.crawled_pages) + len(self.unchanged_pages)
+    
+    def _enqueue_links(self, links, depth):
+        """Queue links found on a page; caller must hold self._lock"""
+        # Links past max_depth would only be rejected by crawl_page
+        if depth + 1 > self.max_depth:
+            return
+        
+        for link in links:
+            if (link not in self.visited_urls and link not in self.queued_urls and
+                    link not in self.rejected_urls):
+                self.url_queue.append((link, depth + 1))
+                self.queued_urls.add(link)
     
     def crawl_page(self, url, depth=0):
-        """Crawl a single page"""
-        if (url in self.visited_urls or 
-            len(self.crawled_pages) >= self.max_pages or
-            depth > self.max_depth):
-            return None
+        """Crawl and parse a single page"""
+        with self._lock:
+            if (url in self.visited_urls or 
+                self.page_count() >= self.max_pages or
+                depth > self.max_depth):
+                return None
         
         if not self.can_fetch(url):
             self.logger.info(f"Robots.txt disallows crawling: {url}")
+            self._reject(url)
             return None
         
         try:
             self.logger.info(f"Crawling: {url}")
-            response = self.session.get(url, timeout=10)
-            response.raise_for_status()
+            cached = self.crawl_cache.get(url) if self.crawl_cache else None
             
-            # Only process HTML content
-            content_type = response.headers.get('content-type', '').lower()
-            if 'text/html' not in content_type:
-                return None
+            # The crawl cache can outlive the index (e.g. after a rebuild), so a
+            # page missing from the index is fetched and parsed in full
+            if cached is not None and not self.is_indexed(url):
+                cached = None
             
-            self.visited_urls.add(url)
+            host = self.get_host(url)
+            self._wait_for_host(host)
+            try:
+                fetched = self.fetch_html(url, cached)
+            finally:
+                self._host_last_fetch[host] = time.time()
+            if fetched is None:
+                self._reject(url)
+                return None
             
-            page_data = {
-                'url': url,
-                'title': '',
-                'content': response.text,
-                'links': [],
-                'depth': depth,
-                'crawl_time': time.time()
-            }
+            content, headers = fetched
+            page_hash = content_hash(content) if content is not None else None
+            unchanged = content is None or (cached is not None and cached['content_hash'] == page_hash)
             
-            # Extract links for further crawling
-            links = self.extract_links(response.text, url)
-            page_data['links'] = links
+            if not unchanged:
+                parsed_page = self.parser.parse_page_in(self._parse_pool, {
+                    'url': url,
+                    'content': content,
+                    'depth': depth,
+                    'crawl_time': time.time()
+                })
+                
+                # Only follow HTTP/HTTPS links
+                links = []
+                if parsed_page:
+                    links = [link['url'] for link in parsed_page['links']
+                             if link['url'].startswith(('http://', 'https://'))]
             
-            # Add new links to queue
-            for link in links:
-                if link not in self.visited_urls:
-                    self.url_queue.append((link, depth + 1))
+            with self._lock:
+                if url in self.visited_urls or self.page_count() >= self.max_pages:
+                    return None
+                self.visited_urls.add(url)
+                
+                # Unchanged since the last crawl: skip parsing and indexing,
+                # but keep following the links it had last time
+                if unchanged:
+                    self.logger.info(f"Unchanged since last crawl: {url}")
+                    self._enqueue_links(cached['links'], depth)
+                    self.unchanged_pages.append(url)
+                    return None
+                
+                if not parsed_page:
+                    return None
+                
+                # Add new links to queue
+                self._enqueue_links(links, depth)
+                self.crawled_pages.append(parsed_page)
             
-            self.crawled_pages.append(page_data)
-            return page_data
+            if self.crawl_cache:
+                self.crawl_cache.record(
+                    url, headers.get('etag'), headers.get('last-modified'),
+                    page_hash, links, parsed_page['crawl_time']
+                )
+            return parsed_page
             
         except Exception as e:
             self.logger.error(f"Error crawling {url}: {e}")
+            self._reject(url)
             return None
     
-    def crawl(self, seed_urls):
-        """Start crawling from seed URLs"""
+    def is_indexed(self, url):
+        """Check whether a URL is in the search index, assuming it is if there's no searcher"""
+        if self.index_searcher is None:
+            return True
+        
+        # Searchers aren't safe to share between threads without a lock
+        with self._index_lock:
+            return self.index_searcher.document_number(url=url) is not None
+    
+    def _reject(self, url):
+        """Remember a URL that can't be crawled so links to it aren't queued again"""
+        with self._lock:
+            self.rejected_urls.add(url)
+    
+    def _wait_for_host(self, host):
+        """Wait out the politeness delay since the last request to a host"""
+        last_fetch = self._host_last_fetch.get(host)
+        if last_fetch is not None:
+            remaining = last_fetch + self.delay - time.time()
+            if remaining > 0:
+                time.sleep(remaining)  # Be polite to servers
+    
+    def _next_url(self, host_queue):
+        """Pop the next not-yet-visited URL from a host queue"""
+        while host_queue:
+            url, depth = host_queue.popleft()
+            with self._lock:
+                self.queued_urls.discard(url)
+            if url not in self.visited_urls:
+                return url, depth
+        return None
+    
+    def crawl(self, seed_urls, index_searcher=None):
+        """Start crawling from seed URLs and return the parsed pages"""
+        self.index_searcher = index_searcher
+        
         # Add seed URLs to queue
+        if self.crawl_cache:
+            self.crawl_cache.discard_pending()
+        
         for url in seed_urls:
             self.url_queue.append((url, 0))
+            self.queued_urls.add(url)
         
-        while self.url_queue and len(self.crawled_pages) < self.max_pages:
-            url, depth = self.url_queue.popleft()
-            
-            if url not in self.visited_urls:
-                self.crawl_page(url, depth)
-                time.sleep(self.delay)  # Be polite to servers
+        # Different hosts are fetched in parallel, but each host only ever has
+        # one request in flight so the per-host delay is preserved.
+        host_queues = defaultdict(deque)
+        in_flight = {}
         
-        self.logger.info(f"Crawling completed. Crawled {len(self.crawled_pages)} pages.")
+        # Parsing is CPU-bound; for big crawls it runs in worker processes
+        # while the fetching threads wait on the results outside the GIL
+        self._parse_pool = self.parser.create_parse_pool(self.max_pages)
+        
+        with self._parse_pool or nullcontext(), \
+                ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while self.page_count() < self.max_pages and not self.stopped:
+                # Move newly discovered links into their host queues
+                while self.url_queue:
+                    url, depth = self.url_queue.popleft()
+                    if url not in self.visited_urls:
+                        host_queues[self.get_host(url)].append((url, depth))
+                
+                busy_hosts = set(in_flight.values())
+                for host in list(host_queues):
+                    if len(in_flight) >= self.max_workers:
+                        break
+                    if host in busy_hosts:
+                        continue
+                    
+                    next_url = self._next_url(host_queues[host])
+                    if not host_queues[host]:
+                        del host_queues[host]
+                    if next_url:
+                        url, depth = next_url
+                        future = executor.submit(self.crawl_page, url, depth)
+                        in_flight[future] = host
+                
+                if not in_flight:
+                    break
+                
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    del in_flight[future]
+        
+        self._parse_pool = None
+        self.index_searcher = None
+        
+        # URLs left over when the crawl stopped early stay queued for the next crawl
+        leftover = [entry for host_queue in host_queues.values() for entry in host_queue]
+        with self._lock:
+            self.url_queue.extendleft(reversed(leftover))
+        
+        self.logger.info(f"Crawling completed. Crawled {len(self.crawled_pages)} pages, "
+                         f"{len(self.unchanged_pages)} unchanged since last crawl.")
         return self.crawled_pages
     
+    def stop(self):
+        """Stop crawling once in-flight requests finish"""
+        self.stopped = True
+    
+    def save_cache(self):
+        """Persist crawl validators once the crawled pages have been indexed"""
+        if self.crawl_cache:
+            self.crawl_cache.flush()
+    
     def get_crawled_data(self):
         """Return crawled data"""
         return self.crawled_pages
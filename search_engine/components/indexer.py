@@ -1,16 +1,40 @@
 from whoosh.index import create_in, open_dir, exists_in
-from whoosh.fields import Schema, TEXT, ID, DATETIME, NUMERIC
+from whoosh.fields import Schema, TEXT, ID, DATETIME, NUMERIC, STORED
 from whoosh.analysis import StemmingAnalyzer
 from whoosh.writing import AsyncWriter
+from whoosh.reading import SegmentReader
+from contextlib import contextmanager
 import os
 import logging
+import threading
 from datetime import datetime
 
+# Memory each writer may buffer before flushing a segment to disk
+WRITER_LIMIT_MB = 256
+
+# Characters of page content kept in the index for result snippets
+SNIPPET_LENGTH = 300
+
+# Batches at least this large are indexed by several writer processes
+PARALLEL_INDEX_MIN_PAGES = 200
+
+# Seconds to wait for another writer (e.g. a concurrent crawl job) to release the index lock
+WRITER_LOCK_TIMEOUT = 600
+
+def make_snippet(content):
+    """Truncate page content to a result snippet"""
+    if len(content) > SNIPPET_LENGTH:
+        return content[:SNIPPET_LENGTH] + '...'
+    return content
+
 class SearchIndexer:
     def __init__(self, index_dir="data/index"):
         self.index_dir = index_dir
         self.logger = logging.getLogger(__name__)
         
+        # Writer shared by update/delete calls inside batch_writer()
+        self._local = threading.local()
+        
         # Create index directory if it doesn't exist
         os.makedirs(index_dir, exist_ok=True)
         
@@ -18,7 +42,9 @@ class SearchIndexer:
         self.schema = Schema(
             url=ID(stored=True, unique=True),
             title=TEXT(stored=True, analyzer=StemmingAnalyzer()),
-            content=TEXT(stored=True, analyzer=StemmingAnalyzer()),
+            # Full content is only indexed; results show the stored snippet
+            content=TEXT(analyzer=StemmingAnalyzer()),
+            snippet=STORED,
             meta_description=TEXT(stored=True),
             headings=TEXT(stored=True),
             content_length=NUMERIC(stored=True),
@@ -34,8 +60,12 @@ class SearchIndexer:
             self.index = open_dir(index_dir)
             self.logger.info("Opened existing search index")
     
+    def open_writer(self, **writer_args):
+        """Open an index writer, waiting for any other writer to finish first"""
+        return self.index.writer(timeout=WRITER_LOCK_TIMEOUT, delay=0.25, **writer_args)
+    
     def add_document(self, writer, parsed_page):
-        """Add a single document to the index"""
+        """Add a single document to the index, replacing any with the same URL"""
         try:
             # Combine headings into a single text field
             headings_text = " ".join([h['text'] for h in parsed_page.get('headings', [])])
@@ -43,23 +73,37 @@ class SearchIndexer:
             # Convert crawl_time to datetime
             crawl_datetime = datetime.fromtimestamp(parsed_page.get('crawl_time', 0))
             
-            writer.add_document(
-                url=parsed_page['url'],
-                title=parsed_page.get('title', ''),
-                content=parsed_page.get('content', ''),
-                meta_description=parsed_page.get('meta_description', ''),
-                headings=headings_text,
-                content_length=parsed_page.get('content_length', 0),
-                crawl_time=crawl_datetime,
-                depth=parsed_page.get('depth', 0)
-            )
+            content = parsed_page.get('content', '')
+            fields = {
+                'url': parsed_page['url'],
+                'title': parsed_page.get('title', ''),
+                'content': content,
+                'meta_description': parsed_page.get('meta_description', ''),
+                'headings': headings_text,
+                'content_length': parsed_page.get('content_length', 0),
+                'crawl_time': crawl_datetime,
+                'depth': parsed_page.get('depth', 0)
+            }
+            
+            # Indexes created before the snippet field still store full content
+            if 'snippet' in self.index.schema:
+                fields['snippet'] = make_snippet(content)
+            
+            # url is unique, so a re-crawled page replaces its old document even if
+            # another writer indexed it after this crawl started
+            writer.update_document(**fields)
             
         except Exception as e:
             self.logger.error(f"Error adding document {parsed_page.get('url', 'unknown')}: {e}")
     
     def index_pages(self, parsed_pages):
         """Index multiple parsed pages"""
-        writer = self.index.writer()
+        writer_args = {'limitmb': WRITER_LIMIT_MB}
+        procs = max(1, (os.cpu_count() or 1) // 2)
+        if procs > 1 and len(parsed_pages) >= PARALLEL_INDEX_MIN_PAGES:
+            writer_args.update(procs=procs, multisegment=True)
+        
+        writer = self.open_writer(**writer_args)
         
         try:
             for parsed_page in parsed_pages:
@@ -73,9 +117,30 @@ class SearchIndexer:
             self.logger.error(f"Error during indexing: {e}")
             raise
     
+    @contextmanager
+    def batch_writer(self):
+        """Group several update_document/delete_document calls into one commit"""
+        writer = self.open_writer(limitmb=WRITER_LIMIT_MB)
+        self._local.writer = writer
+        
+        try:
+            yield writer
+            writer.commit()
+        except Exception:
+            writer.cancel()
+            raise
+        finally:
+            self._local.writer = None
+    
     def update_document(self, parsed_page):
         """Update a single document in the index"""
-        writer = self.index.writer()
+        batch = getattr(self._local, 'writer', None)
+        if batch is not None:
+            batch.delete_by_term('url', parsed_page['url'])
+            self.add_document(batch, parsed_page)
+            return
+        
+        writer = self.open_writer()
         
         try:
             # Delete existing document with same URL
@@ -94,7 +159,12 @@ class SearchIndexer:
     
     def delete_document(self, url):
         """Delete a document from the index by URL"""
-        writer = self.index.writer()
+        batch = getattr(self._local, 'writer', None)
+        if batch is not None:
+            batch.delete_by_term('url', url)
+            return
+        
+        writer = self.open_writer()
         
         try:
             writer.delete_by_term('url', url)
@@ -115,12 +185,44 @@ class SearchIndexer:
                 'index_directory': self.index_dir
             }
     
+    def get_generation(self):
+        """Get the generation of the latest index commit, or None if it can't be read"""
+        try:
+            return self.index.latest_generation()
+        except Exception as e:
+            self.logger.error(f"Error reading index generation: {e}")
+            return None
+    
     def optimize_index(self):
         """Optimize the index for better search performance"""
         try:
-            with self.index.writer() as writer:
-                writer.mergetype = self.index.CLEAR
+            # Merge every segment into one; query cost grows with segment count
+            writer = self.open_writer()
+            writer.commit(optimize=True)
             self.logger.info("Index optimized successfully")
         except Exception as e:
             self.logger.error(f"Error optimizing index: {e}")
             raise
+    
+    def merge_segments(self, max_segments=4):
+        """Merge the smallest segments together until at most max_segments remain"""
+        def merge_smallest(writer, segments):
+            if len(segments) <= max_segments:
+                return segments
+            
+            # The merged segments become one new segment alongside the kept ones
+            by_size = sorted(segments, key=lambda segment: segment.doc_count_all())
+            merge_count = len(segments) - max(1, max_segments) + 1
+            for segment in by_size[:merge_count]:
+                reader = SegmentReader(writer.storage, writer.schema, segment)
+                writer.add_reader(reader)
+                reader.close()
+            return by_size[merge_count:]
+        
+        try:
+            writer = self.open_writer()
+            writer.commit(mergetype=merge_smallest)
+            self.logger.info("Index segments merged successfully")
+        except Exception as e:
+            self.logger.error(f"Error merging index segments: {e}")
+            raise
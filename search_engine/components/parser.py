@@ -1,7 +1,49 @@
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, NavigableString, CData
+from urllib.parse import urljoin
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+import os
 import re
 import logging
 
+# lxml's C parser is an order of magnitude faster than the pure-Python
+# html.parser backend; fall back to the latter when lxml isn't installed
+try:
+    import lxml
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+
+_WS_RE = re.compile(r'\s+')
+_CONTENT_CLASS_RE = re.compile(r'content|main|article|body', re.I)
+
+# Elements whose text never counts as page content
+_SKIP_TAGS = frozenset(['script', 'style', 'nav', 'header', 'footer', 'aside'])
+
+# Skipped elements that only hold raw text, so there is nothing to descend into
+_OPAQUE_TAGS = frozenset(['script', 'style'])
+
+_CONTENT_TAGS = frozenset(['main', 'article', 'div'])
+_HEADING_LEVELS = {f'h{i}': i for i in range(1, 7)}
+
+# String types that get_text() includes; comments, doctypes etc. are skipped
+_TEXT_TYPES = (NavigableString, CData)
+
+# Smaller batches are parsed inline; starting worker processes costs more
+PARALLEL_PARSE_MIN_PAGES = 20
+
+# Parse workers are forked from a fork server rather than from the app, whose
+# other threads (Flask requests, the scheduler, other crawl jobs) may be holding
+# locks at that moment. The server only preloads this module instead of the
+# default of re-running the entry script. Each worker still re-runs the entry
+# script as __mp_main__, so it must not start anything at import (app.py skips
+# its setup). Without a fork server, pages are parsed inline.
+if 'forkserver' in multiprocessing.get_all_start_methods():
+    PARSE_MP_CONTEXT = multiprocessing.get_context('forkserver')
+    PARSE_MP_CONTEXT.set_forkserver_preload([__name__])
+else:
+    PARSE_MP_CONTEXT = None
+
 class WebParser:
     def __init__(self):
         self.logger = logging.getLogger(__name__)
@@ -9,98 +51,101 @@ class WebParser:
     def clean_text(self, text):
         """Clean and normalize text"""
         # Remove extra whitespace and newlines
-        text = re.sub(r'\s+', ' ', text)
-        text = text.strip()
-        return text
+        return _WS_RE.sub(' ', text).strip()
     
-    def extract_title(self, soup):
-        """Extract page title"""
-        title_tag = soup.find('title')
-        if title_tag:
-            return self.clean_text(title_tag.get_text())
-        
-        # Fallback to h1 tag
-        h1_tag = soup.find('h1')
-        if h1_tag:
-            return self.clean_text(h1_tag.get_text())
-        
-        return "No Title"
-    
-    def extract_meta_description(self, soup):
-        """Extract meta description"""
-        meta_desc = soup.find('meta', attrs={'name': 'description'})
-        if meta_desc and meta_desc.get('content'):
-            return self.clean_text(meta_desc['content'])
-        return ""
+    def is_content_tag(self, tag):
+        """Check whether a tag looks like a main content container"""
+        if tag.name not in _CONTENT_TAGS:
+            return False
+        return any(_CONTENT_CLASS_RE.search(cls) for cls in tag.get('class') or [])
     
-    def extract_content(self, soup):
-        """Extract main content from the page"""
-        # Remove script and style elements
-        for script in soup(["script", "style", "nav", "header", "footer", "aside"]):
-            script.decompose()
-        
-        # Try to find main content areas
-        main_content = ""
+    def walk_tree(self, soup, base_url):
+        """Extract title, meta description, content, headings and links in one pass"""
+        title = None
+        first_h1 = None
+        meta_description = None
+        headings = []
+        links = []
+        content_parts = []
+        body_parts = []
         
-        # Look for main content tags
-        content_tags = soup.find_all(['main', 'article', 'div'], 
-                                   class_=re.compile(r'content|main|article|body', re.I))
+        # Each entry carries whether the node sits inside a skipped element
+        # (script, nav, ...), a main content container, and the body
+        stack = [(soup, False, False, False)]
+        while stack:
+            node, skipped, in_content, in_body = stack.pop()
+            
+            if isinstance(node, NavigableString):
+                if not skipped and type(node) in _TEXT_TYPES:
+                    if in_content:
+                        content_parts.append(node)
+                    if in_body:
+                        body_parts.append(node)
+                continue
+            
+            name = node.name
+            if name == 'title' and title is None:
+                title = node.get_text()
+            elif name == 'h1' and first_h1 is None:
+                first_h1 = node.get_text()
+            elif name == 'meta' and meta_description is None and node.get('name') == 'description':
+                meta_description = node.get('content') or ''
+            elif name == 'body':
+                in_body = True
+            elif name == 'a' and node.has_attr('href'):
+                # Links in navigation, headers and footers still count;
+                # the crawler follows them to discover pages
+                links.append({
+                    'url': urljoin(base_url, node['href']),
+                    'text': self.clean_text(node.get_text()),
+                    'title': node.get('title', '')
+                })
+            
+            if name in _SKIP_TAGS:
+                skipped = True
+            
+            if not skipped:
+                level = _HEADING_LEVELS.get(name)
+                if level:
+                    headings.append({
+                        'level': level,
+                        'text': self.clean_text(node.get_text())
+                    })
+                
+                if not in_content and self.is_content_tag(node):
+                    in_content = True
+                    if content_parts:
+                        content_parts.append(' ')
+            
+            if name not in _OPAQUE_TAGS:
+                stack.extend((child, skipped, in_content, in_body) for child in reversed(node.contents))
         
-        if content_tags:
-            for tag in content_tags:
-                main_content += tag.get_text() + " "
-        else:
-            # Fallback to body content
-            body = soup.find('body')
-            if body:
-                main_content = body.get_text()
+        if title is None:
+            title = first_h1
         
-        return self.clean_text(main_content)
-    
-    def extract_headings(self, soup):
-        """Extract all headings (h1-h6)"""
-        headings = []
-        for i in range(1, 7):
-            for heading in soup.find_all(f'h{i}'):
-                headings.append({
-                    'level': i,
-                    'text': self.clean_text(heading.get_text())
-                })
-        return headings
-    
-    def extract_links(self, soup, base_url):
-        """Extract all links from the page"""
-        from urllib.parse import urljoin
+        # Prefer the main content containers, falling back to the whole body
+        content = ''.join(content_parts) if content_parts else ''.join(body_parts)
         
-        links = []
-        for link in soup.find_all('a', href=True):
-            href = link['href']
-            absolute_url = urljoin(base_url, href)
-            link_text = self.clean_text(link.get_text())
-            
-            links.append({
-                'url': absolute_url,
-                'text': link_text,
-                'title': link.get('title', '')
-            })
+        # Keep headings grouped by level (h1s first, then h2s, ...)
+        headings.sort(key=lambda h: h['level'])
         
-        return links
+        return {
+            'title': self.clean_text(title) if title is not None else "No Title",
+            'meta_description': self.clean_text(meta_description or ''),
+            'content': self.clean_text(content),
+            'headings': headings,
+            'links': links
+        }
     
     def parse_page(self, page_data):
         """Parse a single page and extract structured data"""
         try:
-            soup = BeautifulSoup(page_data['content'], 'html.parser')
+            soup = BeautifulSoup(page_data['content'], HTML_PARSER)
             
-            parsed_data = {
-                'url': page_data['url'],
-                'title': self.extract_title(soup),
-                'meta_description': self.extract_meta_description(soup),
-                'content': self.extract_content(soup),
-                'headings': self.extract_headings(soup),
-                'links': self.extract_links(soup, page_data['url']),
-                'crawl_time': page_data.get('crawl_time', 0),
-                'depth': page_data.get('depth', 0)
-            }
+            parsed_data = {'url': page_data['url']}
+            parsed_data.update(self.walk_tree(soup, page_data['url']))
+            parsed_data['crawl_time'] = page_data.get('crawl_time', 0)
+            parsed_data['depth'] = page_data.get('depth', 0)
             
             # Calculate content length
             parsed_data['content_length'] = len(parsed_data['content'])
@@ -111,14 +156,43 @@ class WebParser:
             self.logger.error(f"Error parsing page {page_data.get('url', 'unknown')}: {e}")
             return None
     
+    def create_parse_pool(self, page_count):
+        """Create a process pool for parsing page_count pages, or None if it isn't worth it"""
+        workers = os.cpu_count() or 1
+        
+        if PARSE_MP_CONTEXT is not None and workers > 1 and page_count >= PARALLEL_PARSE_MIN_PAGES:
+            pool = ProcessPoolExecutor(max_workers=workers, mp_context=PARSE_MP_CONTEXT)
+            # Start the fork server and a first worker now; later workers start on demand
+            pool.submit(int).result()
+            return pool
+        return None
+    
+    def parse_page_in(self, pool, page_data):
+        """Parse a single page in a process pool, or in this process if pool is None"""
+        if pool is None:
+            return self.parse_page(page_data)
+        return pool.submit(_parse_one, page_data).result()
+    
     def parse_pages(self, crawled_pages):
         """Parse multiple pages"""
-        parsed_pages = []
+        pool = self.create_parse_pool(len(crawled_pages))
         
-        for page_data in crawled_pages:
-            parsed_page = self.parse_page(page_data)
-            if parsed_page:
-                parsed_pages.append(parsed_page)
+        if pool is not None:
+            # Parsing is CPU-bound, so spread pages across processes
+            with pool:
+                results = pool.map(_parse_one, crawled_pages, chunksize=4)
+                parsed_pages = [parsed_page for parsed_page in results if parsed_page]
+        else:
+            parsed_pages = []
+            for page_data in crawled_pages:
+                parsed_page = self.parse_page(page_data)
+                if parsed_page:
+                    parsed_pages.append(parsed_page)
         
         self.logger.info(f"Parsed {len(parsed_pages)} pages successfully.")
         return parsed_pages
+
+
+def _parse_one(page_data):
+    """Parse a single page inside a worker process"""
+    return WebParser().parse_page(page_data)
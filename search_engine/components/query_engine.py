@@ -2,24 +2,58 @@ from whoosh.index import open_dir
 from whoosh.qparser import QueryParser, MultifieldParser
 from whoosh.query import And, Or, Term
 from whoosh.scoring import BM25F
+from .indexer import make_snippet
+from .ranking import DEFAULT_WEIGHTS
+from contextlib import contextmanager
+import threading
 import logging
 import re
 
+# Characters kept in queries: words, whitespace, quotes and query operators
+_QUERY_STRIP_RE = re.compile(r'[^\w\s\"\'\+\-\*\(\)]')
+_WS_RE = re.compile(r'\s+')
+
+# Most frequent title terms kept between index changes
+MAX_POPULAR_TERMS = 1000
+
+# BM25F field boosts, taken from the default ranking weights so the reranker
+# can be skipped whenever those weights are in use
+FIELD_BOOSTS = {
+    'title': DEFAULT_WEIGHTS['title_match'],
+    'content': DEFAULT_WEIGHTS['content_match'],
+    'meta_description': DEFAULT_WEIGHTS['meta_description_match'],
+    'headings': DEFAULT_WEIGHTS['heading_match']
+}
+
 class QueryEngine:
     def __init__(self, index_dir="data/index"):
         self.index_dir = index_dir
         self.logger = logging.getLogger(__name__)
         
+        # Sorted popular title terms and the index generation they came from
+        self._popular_terms = None
+        self._popular_terms_gen = None
+        
+        # Query parsers for explicit field lists, keyed by the field tuple
+        self._parsers = {}
+        self._parsers_lock = threading.Lock()
+        
+        # Idle searchers shared by request threads; one is checked out per query
+        self._searchers = []
+        self._searchers_lock = threading.Lock()
+        
         try:
             self.index = open_dir(index_dir)
-            self.searcher = self.index.searcher()
+            self.weighting = BM25F()
+            self._searchers.append(self.index.searcher(weighting=self.weighting))
             
             # Create query parsers
             self.title_parser = QueryParser("title", self.index.schema)
             self.content_parser = QueryParser("content", self.index.schema)
             self.multifield_parser = MultifieldParser(
                 ["title", "content", "meta_description", "headings"], 
-                self.index.schema
+                self.index.schema,
+                fieldboosts=FIELD_BOOSTS
             )
             
             self.logger.info("Query engine initialized successfully")
@@ -31,12 +65,68 @@ class QueryEngine:
     def preprocess_query(self, query_string):
         """Clean and preprocess the query string"""
         # Remove special characters except quotes and common operators
-        query_string = re.sub(r'[^\w\s\"\'\+\-\*\(\)]', ' ', query_string)
+        query_string = _QUERY_STRIP_RE.sub(' ', query_string)
         
         # Collapse multiple spaces
-        query_string = re.sub(r'\s+', ' ', query_string).strip()
+        return _WS_RE.sub(' ', query_string).strip()
+    
+    @contextmanager
+    def searcher(self):
+        """Check out a searcher that is current with the latest index commit"""
+        with self._searchers_lock:
+            searcher = self._searchers.pop() if self._searchers else None
+        
+        if searcher is None:
+            searcher = self.index.searcher(weighting=self.weighting)
+        else:
+            # Cheap when nothing changed; reopens only the segments that did
+            refreshed = searcher.refresh()
+            if refreshed is not searcher:
+                self.logger.info("Index changed, reopened searcher")
+                searcher = refreshed
+        
+        try:
+            yield searcher
+        finally:
+            with self._searchers_lock:
+                self._searchers.append(searcher)
+    
+    def get_parser(self, fields=None):
+        """Get the query parser for the given fields"""
+        if not fields:
+            return self.multifield_parser
+        
+        key = tuple(fields)
+        with self._parsers_lock:
+            parser = self._parsers.get(key)
+            if parser is None:
+                if len(fields) == 1:
+                    parser = QueryParser(fields[0], self.index.schema)
+                else:
+                    parser = MultifieldParser(fields, self.index.schema)
+                self._parsers[key] = parser
+        return parser
+    
+    def format_result(self, result):
+        """Convert a Whoosh hit into a result dictionary"""
+        # Load the stored fields once rather than once per key
+        fields = result.fields()
+        
+        snippet = fields.get('snippet')
+        if snippet is None:
+            # Older indexes store the full content instead of a snippet
+            snippet = make_snippet(fields.get('content', ''))
         
-        return query_string
+        return {
+            'url': fields['url'],
+            'title': fields['title'],
+            'content': snippet,
+            'meta_description': fields['meta_description'],
+            'score': result.score,
+            'content_length': fields['content_length'],
+            'crawl_time': fields['crawl_time'],
+            'depth': fields['depth']
+        }
     
     def search(self, query_string, limit=10, fields=None):
         """Perform a search query"""
@@ -47,35 +137,15 @@ class QueryEngine:
             if not clean_query:
                 return []
             
-            # Choose appropriate parser
-            if fields:
-                if len(fields) == 1:
-                    parser = QueryParser(fields[0], self.index.schema)
-                else:
-                    parser = MultifieldParser(fields, self.index.schema)
-            else:
-                parser = self.multifield_parser
-            
-            # Parse query
-            query = parser.parse(clean_query)
-            
-            # Perform search
-            results = self.searcher.search(query, limit=limit)
-            
-            # Format results
-            formatted_results = []
-            for result in results:
-                formatted_result = {
-                    'url': result['url'],
-                    'title': result['title'],
-                    'content': result['content'][:300] + '...' if len(result['content']) > 300 else result['content'],
-                    'meta_description': result['meta_description'],
-                    'score': result.score,
-                    'content_length': result['content_length'],
-                    'crawl_time': result['crawl_time'],
-                    'depth': result['depth']
-                }
-                formatted_results.append(formatted_result)
+            with self.searcher() as searcher:
+                # Parse query
+                query = self.get_parser(fields).parse(clean_query)
+                
+                # Perform search
+                results = searcher.search(query, limit=limit)
+                
+                # Format results
+                formatted_results = [self.format_result(result) for result in results]
             
             self.logger.info(f"Search for '{query_string}' returned {len(formatted_results)} results")
             return formatted_results
@@ -84,6 +154,46 @@ class QueryEngine:
             self.logger.error(f"Error performing search for '{query_string}': {e}")
             return []
     
+    def search_page(self, query_string, page=1, per_page=10, fields=None):
+        """Perform a search query and return a single page of results"""
+        empty_page = {'results': [], 'total': 0, 'page': page, 'page_count': 0}
+        
+        try:
+            clean_query = self.preprocess_query(query_string)
+            
+            if not clean_query:
+                return empty_page
+            
+            with self.searcher() as searcher:
+                query = self.get_parser(fields).parse(clean_query)
+                
+                # Only hits on the requested page have their stored fields loaded
+                results = searcher.search_page(query, max(1, page), pagelen=per_page)
+                
+                if not results.total:
+                    return empty_page
+                
+                # Whoosh clamps the page number to the last page; past the end there are no hits
+                if page > results.pagecount:
+                    return dict(empty_page, total=results.total, page_count=results.pagecount)
+                
+                formatted_results = [self.format_result(result) for result in results]
+                
+                results_page = {
+                    'results': formatted_results,
+                    'total': results.total,
+                    'page': results.pagenum,
+                    'page_count': results.pagecount
+                }
+            
+            self.logger.info(f"Search for '{query_string}' page {results.pagenum} "
+                             f"returned {len(formatted_results)} of {results.total} results")
+            return results_page
+            
+        except Exception as e:
+            self.logger.error(f"Error performing search for '{query_string}': {e}")
+            return empty_page
+    
     def suggest_query(self, partial_query, limit=5):
         """Suggest query completions based on indexed content"""
         try:
@@ -92,15 +202,16 @@ class QueryEngine:
             
             # Search for partial matches in titles
             query = self.title_parser.parse(f"{partial_query}*")
-            results = self.searcher.search(query, limit=limit*2)
             
             # Extract unique words from titles
             words = set()
-            for result in results:
-                title_words = result['title'].lower().split()
-                for word in title_words:
-                    if word.startswith(partial_query.lower()) and len(word) > len(partial_query):
-                        words.add(word)
+            with self.searcher() as searcher:
+                results = searcher.search(query, limit=limit*2)
+                for result in results:
+                    title_words = result['title'].lower().split()
+                    for word in title_words:
+                        if word.startswith(partial_query.lower()) and len(word) > len(partial_query):
+                            words.add(word)
             
             suggestions = list(words)[:limit]
             return suggestions
@@ -115,29 +226,37 @@ class QueryEngine:
             # This is a simplified implementation
             # In a real system, you'd track actual search queries
             
-            popular_terms = []
+            # Term frequencies only change when the index does
+            with self.searcher() as searcher:
+                reader = searcher.reader()
+                generation = reader.generation()
+                
+                if self._popular_terms is None or self._popular_terms_gen != generation:
+                    # Get most frequent terms from title field in a single pass
+                    title_field = self.index.schema['title']
+                    term_freq = []
+                    
+                    for term_bytes, term_info in reader.iter_field("title"):
+                        term = title_field.from_bytes(term_bytes)
+                        if len(term) > 3:  # Only consider words longer than 3 characters
+                            term_freq.append((term, term_info.doc_frequency()))
+                    
+                    # Sort by frequency and keep the top terms
+                    term_freq.sort(key=lambda x: x[1], reverse=True)
+                    self._popular_terms = [term for term, freq in term_freq[:MAX_POPULAR_TERMS]]
+                    self._popular_terms_gen = generation
             
-            # Get most frequent terms from title field
-            field_terms = self.searcher.field_terms("title")
-            term_freq = {}
-            
-            for term in field_terms:
-                if len(term) > 3:  # Only consider words longer than 3 characters
-                    freq = self.searcher.doc_frequency("title", term)
-                    term_freq[term] = freq
-            
-            # Sort by frequency and return top terms
-            sorted_terms = sorted(term_freq.items(), key=lambda x: x[1], reverse=True)
-            popular_terms = [term for term, freq in sorted_terms[:limit]]
-            
-            return popular_terms
+            return self._popular_terms[:limit]
             
         except Exception as e:
             self.logger.error(f"Error getting popular queries: {e}")
             return []
     
     def close(self):
-        """Close the searcher"""
-        if hasattr(self, 'searcher'):
-            self.searcher.close()
-            self.logger.info("Query engine closed")
+        """Close the idle searchers"""
+        with self._searchers_lock:
+            searchers, self._searchers = self._searchers, []
+        
+        for searcher in searchers:
+            searcher.close()
+        self.logger.info("Query engine closed")
@@ -2,32 +2,77 @@ import math
 import logging
 from collections import defaultdict
 
+# Default ranking weights; the query engine builds its BM25F field boosts from the match weights
+DEFAULT_WEIGHTS = {
+    'title_match': 3.0,
+    'content_match': 1.0,
+    'meta_description_match': 2.0,
+    'heading_match': 2.5,
+    'url_match': 1.5,
+    'freshness': 1.0,
+    'content_length': 0.5,
+    'depth_penalty': -0.2
+}
+
 class SearchRanking:
     def __init__(self):
         self.logger = logging.getLogger(__name__)
         
         # Ranking weights
-        self.weights = {
-            'title_match': 3.0,
-            'content_match': 1.0,
-            'meta_description_match': 2.0,
-            'heading_match': 2.5,
-            'url_match': 1.5,
-            'freshness': 1.0,
-            'content_length': 0.5,
-            'depth_penalty': -0.2
+        self.weights = dict(DEFAULT_WEIGHTS)
+        self.combine_scores = self.build_combiner()
+    
+    def build_combiner(self):
+        """Build a function computing the weighted total score for the current weights"""
+        # Bind the weights to locals once instead of looking them up for every result
+        title_weight = self.weights['title_match']
+        content_weight = self.weights['content_match']
+        meta_weight = self.weights['meta_description_match']
+        heading_weight = self.weights['heading_match']
+        url_weight = self.weights['url_match']
+        freshness_weight = self.weights['freshness']
+        content_length_weight = self.weights['content_length']
+        depth_weight = abs(self.weights['depth_penalty'])
+        
+        def combine_scores(title_score, content_score, meta_score, heading_score, url_score,
+                           freshness_score, content_length_score, depth_penalty):
+            return (
+                title_score * title_weight +
+                content_score * content_weight +
+                meta_score * meta_weight +
+                heading_score * heading_weight +
+                url_score * url_weight +
+                freshness_score * freshness_weight +
+                content_length_score * content_length_weight -
+                depth_penalty * depth_weight
+            )
+        
+        return combine_scores
+    
+    def calculate_document_frequencies(self, query_terms, all_documents):
+        """Count how many documents contain each (lowercase) query term"""
+        all_documents_lower = [doc.lower() for doc in all_documents]
+        
+        return {
+            term: sum(1 for doc in all_documents_lower if term in doc)
+            for term in set(query_terms)
         }
     
-    def calculate_tf_idf(self, term, document, all_documents):
+    def calculate_tf_idf(self, term, document_lower, doc_frequencies, total_documents,
+                         term_count=None, doc_length=None):
         """Calculate Term Frequency-Inverse Document Frequency"""
         # Term frequency in document
-        tf = document.lower().count(term.lower()) / len(document.split())
+        if term_count is None:
+            term_count = document_lower.count(term)
+        if doc_length is None:
+            doc_length = len(document_lower.split())
+        tf = term_count / doc_length
         
         # Document frequency (how many documents contain the term)
-        df = sum(1 for doc in all_documents if term.lower() in doc.lower())
+        df = doc_frequencies[term]
         
         # Inverse document frequency
-        idf = math.log(len(all_documents) / (df + 1))
+        idf = math.log(total_documents / (df + 1))
         
         return tf * idf
     
@@ -39,8 +84,7 @@ class SearchRanking:
         title_lower = title.lower()
         score = 0
         
-        for term in query_terms:
-            term_lower = term.lower()
+        for term_lower in query_terms:
             if term_lower in title_lower:
                 # Exact match gets higher score
                 if term_lower == title_lower:
@@ -54,28 +98,34 @@ class SearchRanking:
         
         return score
     
-    def calculate_content_score(self, query_terms, content, all_contents):
+    def calculate_content_score(self, query_terms, content, doc_frequencies, total_documents,
+                                doc_length=None):
         """Calculate score based on content matches"""
         if not content:
             return 0
         
         score = 0
         content_lower = content.lower()
+        if doc_length is None:
+            doc_length = len(content.split())
         
-        for term in query_terms:
-            term_lower = term.lower()
+        for term_lower in query_terms:
+            # A term missing from the content adds nothing, so skip the other scans
+            first_occurrence = content_lower.find(term_lower)
+            if first_occurrence == -1:
+                continue
             
-            # Count occurrences
-            occurrences = content_lower.count(term_lower)
+            # Count occurrences, starting from the first one already found
+            occurrences = content_lower.count(term_lower, first_occurrence)
             
             # Calculate TF-IDF
-            tf_idf = self.calculate_tf_idf(term, content, all_contents)
+            tf_idf = self.calculate_tf_idf(
+                term_lower, content_lower, doc_frequencies, total_documents,
+                occurrences, doc_length
+            )
             
             # Position bonus (terms appearing early get higher score)
-            first_occurrence = content_lower.find(term_lower)
-            position_bonus = 1.0
-            if first_occurrence != -1:
-                position_bonus = 1.0 - (first_occurrence / len(content)) * 0.5
+            position_bonus = 1.0 - (first_occurrence / len(content)) * 0.5
             
             score += occurrences * tf_idf * position_bonus
         
@@ -89,8 +139,7 @@ class SearchRanking:
         url_lower = url.lower()
         score = 0
         
-        for term in query_terms:
-            term_lower = term.lower()
+        for term_lower in query_terms:
             if term_lower in url_lower:
                 score += 1
         
@@ -146,16 +195,22 @@ class SearchRanking:
         if not results:
             return results
         
+        # Lowercase query terms once; the scoring helpers expect lowercase terms
         query_terms = query_string.lower().split()
         all_contents = [result.get('content', '') for result in results]
         
+        # Document frequencies and lengths only depend on the result set, so compute them once
+        doc_frequencies = self.calculate_document_frequencies(query_terms, all_contents)
+        doc_lengths = [len(content.split()) for content in all_contents]
+        
+        combine_scores = self.combine_scores
         ranked_results = []
         
-        for result in results:
+        for result, content, doc_length in zip(results, all_contents, doc_lengths):
             # Calculate individual scores
             title_score = self.calculate_title_score(query_terms, result.get('title', ''))
             content_score = self.calculate_content_score(
-                query_terms, result.get('content', ''), all_contents
+                query_terms, content, doc_frequencies, len(all_contents), doc_length
             )
             url_score = self.calculate_url_score(query_terms, result.get('url', ''))
             freshness_score = self.calculate_freshness_score(result.get('crawl_time'))
@@ -173,15 +228,9 @@ class SearchRanking:
             )
             
             # Calculate weighted total score
-            total_score = (
-                title_score * self.weights['title_match'] +
-                content_score * self.weights['content_match'] +
-                meta_score * self.weights['meta_description_match'] +
-                heading_score * self.weights['heading_match'] +
-                url_score * self.weights['url_match'] +
-                freshness_score * self.weights['freshness'] +
-                content_length_score * self.weights['content_length'] -
-                depth_penalty * abs(self.weights['depth_penalty'])
+            total_score = combine_scores(
+                title_score, content_score, meta_score, heading_score, url_score,
+                freshness_score, content_length_score, depth_penalty
             )
             
             # Add the original Whoosh score if available
@@ -213,8 +262,13 @@ class SearchRanking:
     def update_weights(self, new_weights):
         """Update ranking weights"""
         self.weights.update(new_weights)
+        self.combine_scores = self.build_combiner()
         self.logger.info("Ranking weights updated")
     
+    def uses_default_weights(self):
+        """Check whether the weights are unchanged from the defaults"""
+        return self.weights == DEFAULT_WEIGHTS
+    
     def get_weights(self):
         """Get current ranking weights"""
         return self.weights.copy()
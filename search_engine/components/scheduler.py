@@ -1,18 +1,45 @@
 import schedule
 import time
 import threading
+import atexit
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 import json
 import os
 
+# orjson serializes the job list several times faster; stdlib json is the fallback
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Crawl jobs allowed to run at the same time
+MAX_CONCURRENT_JOBS = 2
+
+# Longest the scheduler thread sleeps between checks for due jobs
+MAX_IDLE_SECONDS = 60
+
+# Configuration changes made within this many seconds are written together
+CONFIG_SAVE_DELAY = 1.0
+
 class CrawlScheduler:
     def __init__(self, data_dir="data"):
         self.data_dir = data_dir
         self.logger = logging.getLogger(__name__)
         self.crawl_jobs = []
+        self.jobs_by_id = {}
+        self._job_index = {}
         self.is_running = False
         self.scheduler_thread = None
+        self._stop_event = threading.Event()
+        
+        # Jobs run here so a long crawl doesn't hold up the scheduler thread
+        self.job_pool = None
+        self._job_pool_lock = threading.Lock()
+        
+        # Crawlers of running jobs, stopped when the scheduler stops
+        self._active_crawlers = set()
         
         # Create data directory if it doesn't exist
         os.makedirs(data_dir, exist_ok=True)
@@ -22,46 +49,118 @@ class CrawlScheduler:
         
         # Load existing configuration
         self.load_configuration()
+        
+        # Configuration changes are coalesced and written by a background thread
+        self._config_dirty = threading.Event()
+        self._config_lock = threading.Lock()
+        self._config_writer = threading.Thread(target=self._write_configuration_loop, daemon=True)
+        self._config_writer.start()
+        
+        # The writer is a daemon thread; save anything still pending at exit,
+        # such as the final status of a job that finished after stop_scheduler()
+        atexit.register(self.flush_configuration)
     
     def load_configuration(self):
         """Load crawl configuration from file"""
         try:
             if os.path.exists(self.config_file):
-                with open(self.config_file, 'r') as f:
-                    config = json.load(f)
-                    self.crawl_jobs = config.get('crawl_jobs', [])
-                    self.logger.info(f"Loaded {len(self.crawl_jobs)} crawl jobs from configuration")
+                with open(self.config_file, 'rb') as f:
+                    data = f.read()
+                config = orjson.loads(data) if orjson is not None else json.loads(data)
+                self.crawl_jobs = config.get('crawl_jobs', [])
+                
+                # Configurations saved before schedule times were pre-parsed
+                for job in self.crawl_jobs:
+                    if 'schedule_hour' not in job:
+                        job['schedule_hour'], job['schedule_minute'] = \
+                            self.parse_schedule_time(job['schedule_time'])
+                self.logger.info(f"Loaded {len(self.crawl_jobs)} crawl jobs from configuration")
             else:
                 self.crawl_jobs = []
                 self.logger.info("No existing configuration found, starting with empty job list")
         except Exception as e:
             self.logger.error(f"Error loading configuration: {e}")
             self.crawl_jobs = []
+        
+        self.rebuild_job_index()
     
-    def save_configuration(self):
-        """Save crawl configuration to file"""
+    def parse_schedule_time(self, schedule_time):
+        """Split an HH:MM schedule time into hour and minute, or None if it is malformed"""
         try:
-            config = {
-                'crawl_jobs': self.crawl_jobs,
-                'last_updated': datetime.now().isoformat()
-            }
+            hour, minute = int(schedule_time[:2]), int(schedule_time[3:])
+            if not (0 <= hour < 24 and 0 <= minute < 60):
+                raise ValueError("hour or minute out of range")
+            return hour, minute
+        except (TypeError, ValueError) as e:
+            self.logger.error(f"Invalid schedule time '{schedule_time}': {e}")
+            return None, None
+    
+    def job_key(self, seed_urls, max_pages, max_depth):
+        """Key identifying jobs that crawl the same URLs with the same limits"""
+        return (frozenset(seed_urls), max_pages, max_depth)
+    
+    def rebuild_job_index(self):
+        """Rebuild the job ID and job key lookups"""
+        self.jobs_by_id = {}
+        self._job_index = {}
+        for job in self.crawl_jobs:
+            # Keep the first job with a given ID or key, as the lookups always have;
+            # older configurations can hold reused job IDs
+            self.jobs_by_id.setdefault(job['id'], job)
+            key = self.job_key(job['seed_urls'], job['max_pages'], job['max_depth'])
+            self._job_index.setdefault(key, job['id'])
+    
+    def save_configuration(self):
+        """Mark the crawl configuration as changed so it is saved shortly"""
+        self._config_dirty.set()
+    
+    def _write_configuration_loop(self):
+        """Save the configuration whenever it changes, at most once per delay"""
+        while True:
+            self._config_dirty.wait()
+            time.sleep(CONFIG_SAVE_DELAY)
+            self.flush_configuration()
+    
+    def flush_configuration(self):
+        """Save crawl configuration to file if it has unsaved changes"""
+        with self._config_lock:
+            if not self._config_dirty.is_set():
+                return
+            self._config_dirty.clear()
             
-            with open(self.config_file, 'w') as f:
-                json.dump(config, f, indent=2)
+            try:
+                config = {
+                    'crawl_jobs': self.crawl_jobs,
+                    'last_updated': datetime.now().isoformat()
+                }
                 
-            self.logger.info("Configuration saved successfully")
-        except Exception as e:
-            self.logger.error(f"Error saving configuration: {e}")
+                # Write to a temporary file and swap it in so a crash never leaves a partial file
+                tmp_file = self.config_file + ".tmp"
+                if orjson is not None:
+                    data = orjson.dumps(config)
+                else:
+                    data = json.dumps(config, separators=(',', ':')).encode('utf-8')
+                with open(tmp_file, 'wb') as f:
+                    f.write(data)
+                os.replace(tmp_file, self.config_file)
+                
+                self.logger.info("Configuration saved successfully")
+            except Exception as e:
+                self.logger.error(f"Error saving configuration: {e}")
     
     def add_crawl_job(self, name, seed_urls, schedule_type="daily", schedule_time="02:00", 
                       max_pages=100, max_depth=3):
         """Add a new crawl job to the scheduler"""
+        schedule_hour, schedule_minute = self.parse_schedule_time(schedule_time)
         job = {
-            'id': len(self.crawl_jobs) + 1,
+            # One past the highest ID, so IDs aren't reused after a job is removed
+            'id': max((job['id'] for job in self.crawl_jobs), default=0) + 1,
             'name': name,
             'seed_urls': seed_urls,
             'schedule_type': schedule_type,  # daily, weekly, hourly
             'schedule_time': schedule_time,
+            'schedule_hour': schedule_hour,
+            'schedule_minute': schedule_minute,
             'max_pages': max_pages,
             'max_depth': max_depth,
             'created_at': datetime.now().isoformat(),
@@ -71,6 +170,8 @@ class CrawlScheduler:
         }
         
         self.crawl_jobs.append(job)
+        self.jobs_by_id.setdefault(job['id'], job)
+        self._job_index.setdefault(self.job_key(seed_urls, max_pages, max_depth), job['id'])
         self.save_configuration()
         
         self.logger.info(f"Added crawl job: {name}")
@@ -79,44 +180,41 @@ class CrawlScheduler:
     def remove_crawl_job(self, job_id):
         """Remove a crawl job"""
         self.crawl_jobs = [job for job in self.crawl_jobs if job['id'] != job_id]
+        self.rebuild_job_index()
         self.save_configuration()
         self.logger.info(f"Removed crawl job with ID: {job_id}")
     
     def update_job_status(self, job_id, status, last_run=None, next_run=None):
         """Update job status and last run time"""
-        for job in self.crawl_jobs:
-            if job['id'] == job_id:
-                job['status'] = status
-                if last_run:
-                    job['last_run'] = last_run
-                if next_run:
-                    job['next_run'] = next_run
-                elif status == 'completed' and job['schedule_type'] == 'daily':
-                    # Calculate next run for daily jobs
-                    from datetime import datetime, timedelta
-                    try:
-                        next_run_time = datetime.now() + timedelta(days=1)
-                        next_run_time = next_run_time.replace(
-                            hour=int(job['schedule_time'][:2]),
-                            minute=int(job['schedule_time'][3:]),
-                            second=0,
-                            microsecond=0
-                        )
-                        job['next_run'] = next_run_time.isoformat()
-                        job['status'] = 'scheduled'  # Reset to scheduled for next run
-                    except Exception as e:
-                        self.logger.error(f"Error calculating next run: {e}")
-                break
+        job = self.jobs_by_id.get(job_id)
+        if job:
+            job['status'] = status
+            if last_run:
+                job['last_run'] = last_run
+            if next_run:
+                job['next_run'] = next_run
+            elif status == 'completed' and job['schedule_type'] == 'daily':
+                # Calculate next run for daily jobs
+                if job.get('schedule_hour') is not None:
+                    next_run_time = (datetime.now() + timedelta(days=1)).replace(
+                        hour=job['schedule_hour'],
+                        minute=job['schedule_minute'],
+                        second=0,
+                        microsecond=0
+                    )
+                    job['next_run'] = next_run_time.isoformat()
+                    job['status'] = 'scheduled'  # Reset to scheduled for next run
+                else:
+                    self.logger.error(f"Error calculating next run: invalid schedule time "
+                                      f"'{job['schedule_time']}'")
         self.save_configuration()
     
     def find_or_create_manual_job(self, seed_urls, max_pages, max_depth):
         """Find existing job with same parameters or create a temporary one for manual crawls"""
         # Look for existing job with same URLs and parameters
-        for job in self.crawl_jobs:
-            if (set(job['seed_urls']) == set(seed_urls) and 
-                job['max_pages'] == max_pages and 
-                job['max_depth'] == max_depth):
-                return job['id']
+        job_id = self._job_index.get(self.job_key(seed_urls, max_pages, max_depth))
+        if job_id is not None:
+            return job_id
         
         # Create a temporary manual job
         job_name = f"Manual Crawl - {seed_urls[0][:50]}..." if len(seed_urls[0]) > 50 else f"Manual Crawl - {seed_urls[0]}"
@@ -138,32 +236,35 @@ class CrawlScheduler:
             
             # Import here to avoid circular imports
             from .crawler import WebCrawler
-            from .parser import WebParser
             from .indexer import SearchIndexer
             
             # Initialize components
             crawler = WebCrawler(
                 max_pages=job['max_pages'], 
-                max_depth=job['max_depth']
+                max_depth=job['max_depth'],
+                cache_file=os.path.join(self.data_dir, "crawl_cache.db")
             )
-            parser = WebParser()
             indexer = SearchIndexer(index_dir=os.path.join(self.data_dir, "index"))
             
-            # Crawl pages
-            crawled_pages = crawler.crawl(job['seed_urls'])
+            # Crawl pages (the crawler parses each page as it fetches it)
+            with self._job_pool_lock:
+                self._active_crawlers.add(crawler)
+            try:
+                with indexer.index.searcher() as index_searcher:
+                    parsed_pages = crawler.crawl(job['seed_urls'], index_searcher)
+            finally:
+                with self._job_pool_lock:
+                    self._active_crawlers.discard(crawler)
             
-            if crawled_pages:
-                # Parse pages
-                parsed_pages = parser.parse_pages(crawled_pages)
+            if parsed_pages:
+                # Index pages
+                indexer.index_pages(parsed_pages)
+                crawler.save_cache()
                 
-                if parsed_pages:
-                    # Index pages
-                    indexer.index_pages(parsed_pages)
-                    
-                    self.logger.info(f"Crawl job '{job['name']}' completed successfully. "
-                                   f"Processed {len(parsed_pages)} pages.")
-                else:
-                    self.logger.warning(f"No pages were parsed for job '{job['name']}'")
+                self.logger.info(f"Crawl job '{job['name']}' completed successfully. "
+                               f"Processed {len(parsed_pages)} pages.")
+            elif crawler.unchanged_pages:
+                self.logger.info(f"No pages changed since the last run of job '{job['name']}'")
             else:
                 self.logger.warning(f"No pages were crawled for job '{job['name']}'")
             
@@ -173,6 +274,14 @@ class CrawlScheduler:
             self.logger.error(f"Error executing crawl job '{job['name']}': {e}")
             self.update_job_status(job['id'], 'failed')
     
+    def submit_job(self, job):
+        """Run a crawl job on the job pool"""
+        with self._job_pool_lock:
+            if self.job_pool is None:
+                self.job_pool = ThreadPoolExecutor(max_workers=MAX_CONCURRENT_JOBS,
+                                                   thread_name_prefix="crawl-job")
+            return self.job_pool.submit(self.execute_crawl_job, job)
+    
     def schedule_jobs(self):
         """Schedule all crawl jobs"""
         schedule.clear()  # Clear existing schedules
@@ -181,14 +290,14 @@ class CrawlScheduler:
             if job['status'] in ['scheduled', 'completed', 'failed']:
                 if job['schedule_type'] == 'daily':
                     schedule.every().day.at(job['schedule_time']).do(
-                        self.execute_crawl_job, job
+                        self.submit_job, job
                     )
                 elif job['schedule_type'] == 'weekly':
                     schedule.every().week.at(job['schedule_time']).do(
-                        self.execute_crawl_job, job
+                        self.submit_job, job
                     )
                 elif job['schedule_type'] == 'hourly':
-                    schedule.every().hour.do(self.execute_crawl_job, job)
+                    schedule.every().hour.do(self.submit_job, job)
                 
                 self.logger.info(f"Scheduled job '{job['name']}' to run {job['schedule_type']} "
                                f"at {job['schedule_time'] if job['schedule_type'] != 'hourly' else 'every hour'}")
@@ -200,12 +309,18 @@ class CrawlScheduler:
             return
         
         self.is_running = True
+        self._stop_event.clear()
         self.schedule_jobs()
         
         def run_scheduler():
             while self.is_running:
                 schedule.run_pending()
-                time.sleep(60)  # Check every minute
+                
+                # Sleep until the next job is due, checking at least once a minute
+                idle_seconds = schedule.idle_seconds()
+                if idle_seconds is None:
+                    idle_seconds = MAX_IDLE_SECONDS
+                self._stop_event.wait(max(1, min(idle_seconds, MAX_IDLE_SECONDS)))
         
         self.scheduler_thread = threading.Thread(target=run_scheduler, daemon=True)
         self.scheduler_thread.start()
@@ -215,9 +330,22 @@ class CrawlScheduler:
     def stop_scheduler(self):
         """Stop the scheduler"""
         self.is_running = False
+        self._stop_event.set()
         if self.scheduler_thread:
             self.scheduler_thread.join(timeout=5)
         
+        # Pool workers aren't daemon threads, so drop queued jobs and end running
+        # crawls early rather than holding up interpreter exit
+        with self._job_pool_lock:
+            job_pool, self.job_pool = self.job_pool, None
+            for crawler in self._active_crawlers:
+                crawler.stop()
+        if job_pool:
+            job_pool.shutdown(wait=False, cancel_futures=True)
+        
+        # Don't lose changes still waiting for the background writer
+        self.flush_configuration()
+        
         self.logger.info("Scheduler stopped")
     
     def get_job_status(self):
@@ -226,12 +354,11 @@ class CrawlScheduler:
     
     def run_job_now(self, job_id):
         """Run a specific job immediately"""
-        job = next((j for j in self.crawl_jobs if j['id'] == job_id), None)
+        job = self.jobs_by_id.get(job_id)
         
         if job:
-            # Run in a separate thread to avoid blocking
-            thread = threading.Thread(target=self.execute_crawl_job, args=(job,), daemon=True)
-            thread.start()
+            # Run on the job pool to avoid blocking
+            self.submit_job(job)
             self.logger.info(f"Started immediate execution of job '{job['name']}'")
             return True
         else:
@@ -6,6 +6,7 @@ from components.indexer import SearchIndexer
 from components.query_engine import QueryEngine
 from components.scheduler import CrawlScheduler
 from components.ranking import SearchRanking
+from components.cache import TTLCache
 
 class SearchEngine:
     def __init__(self, data_dir="data"):
@@ -23,8 +24,11 @@ class SearchEngine:
         os.makedirs(data_dir, exist_ok=True)
         
         # Initialize components
-        self.crawler = WebCrawler()
         self.parser = WebParser()
+        self.crawler = WebCrawler(
+            cache_file=os.path.join(data_dir, "crawl_cache.db"),
+            parser=self.parser
+        )
         self.indexer = SearchIndexer(self.index_dir)
         self.scheduler = CrawlScheduler(data_dir)
         self.ranking = SearchRanking()
@@ -32,6 +36,10 @@ class SearchEngine:
         # Query engine will be initialized when needed
         self.query_engine = None
         
+        # Results for repeated queries, keyed on the index generation; cleared when ranking changes
+        self.search_cache = TTLCache(maxsize=1024, ttl=300)
+        self.stats_cache = TTLCache(maxsize=1, ttl=5)
+        
         self.logger.info("Search engine initialized successfully")
     
     def crawl_and_index(self, seed_urls, max_pages=50, max_depth=2):
@@ -50,26 +58,26 @@ class SearchEngine:
             self.crawler.max_pages = max_pages
             self.crawler.max_depth = max_depth
             
-            # Crawl pages
-            crawled_pages = self.crawler.crawl(seed_urls)
-            
-            if not crawled_pages:
-                self.logger.warning("No pages were crawled")
-                self.scheduler.update_job_status(job_id, 'failed')
-                return False
-            
-            # Parse pages
-            self.logger.info("Parsing crawled pages...")
-            parsed_pages = self.parser.parse_pages(crawled_pages)
+            # Crawl pages (the crawler parses each page as it fetches it)
+            with self.indexer.index.searcher() as index_searcher:
+                parsed_pages = self.crawler.crawl(seed_urls, index_searcher)
             
             if not parsed_pages:
-                self.logger.warning("No pages were parsed successfully")
+                if self.crawler.unchanged_pages:
+                    self.logger.info("No pages changed since the last crawl")
+                    self.scheduler.update_job_status(job_id, 'completed')
+                    return True
+                
+                self.logger.warning("No pages were crawled")
                 self.scheduler.update_job_status(job_id, 'failed')
                 return False
             
             # Index pages
             self.logger.info("Indexing parsed pages...")
             self.indexer.index_pages(parsed_pages)
+            self.crawler.save_cache()
+            
+            self.clear_search_cache()
             
             # Update job status to completed
             self.scheduler.update_job_status(job_id, 'completed')
@@ -84,30 +92,90 @@ class SearchEngine:
                 self.scheduler.update_job_status(job_id, 'failed')
             return False
     
+    def clear_search_cache(self):
+        """Forget cached search results and index statistics"""
+        self.search_cache.clear()
+        self.stats_cache.clear()
+    
     def search(self, query_string, limit=10, enable_ranking=True):
         """Search the indexed content"""
+        # Keyed on the index generation so commits by other writers (e.g. scheduled
+        # crawl jobs) are never answered from the cache
+        cache_key = ('search', self.indexer.get_generation(), query_string, limit, enable_ranking)
+        cached = self.search_cache.get(cache_key)
+        if cached is not None:
+            return [dict(result) for result in cached]
+        
         try:
             # Initialize query engine if not already done
             if not self.query_engine:
                 self.query_engine = QueryEngine(self.index_dir)
             
+            # Whoosh's BM25F scoring already applies the default weights, so the
+            # Python reranker only runs once the weights have been customized
+            rerank = enable_ranking and not self.ranking.uses_default_weights()
+            
             # Perform search
-            results = self.query_engine.search(query_string, limit=limit*2)  # Get more results for ranking
+            results = self.query_engine.search(
+                query_string, limit=limit*2 if rerank else limit  # Get more results for ranking
+            )
             
             if not results:
                 return []
             
             # Apply custom ranking if enabled
-            if enable_ranking:
+            if rerank:
                 results = self.ranking.rank_results(results, query_string)
+            elif enable_ranking:
+                # The Whoosh score already is the ranking score
+                for result in results:
+                    result['ranking_score'] = result['score']
             
             # Return only the requested number of results
-            return results[:limit]
+            results = results[:limit]
+            self.search_cache.set(cache_key, [dict(result) for result in results])
+            return results
             
         except Exception as e:
             self.logger.error(f"Error during search: {e}")
             return []
     
+    def search_page(self, query_string, page=1, per_page=10, enable_ranking=True):
+        """Search the indexed content and return one page of results"""
+        cache_key = ('page', self.indexer.get_generation(), query_string, page, per_page,
+                     enable_ranking)
+        cached = self.search_cache.get(cache_key)
+        if cached is not None:
+            return dict(cached, results=[dict(result) for result in cached['results']])
+        
+        try:
+            # Initialize query engine if not already done
+            if not self.query_engine:
+                self.query_engine = QueryEngine(self.index_dir)
+            
+            results_page = self.query_engine.search_page(query_string, page, per_page)
+            
+            # Custom ranking reorders hits within the page
+            rerank = enable_ranking and not self.ranking.uses_default_weights()
+            if rerank and results_page['results']:
+                results_page['results'] = self.ranking.rank_results(
+                    results_page['results'], query_string
+                )
+            elif enable_ranking:
+                # The Whoosh score already is the ranking score
+                for result in results_page['results']:
+                    result['ranking_score'] = result['score']
+            
+            if results_page['results']:
+                self.search_cache.set(cache_key, dict(
+                    results_page, results=[dict(result) for result in results_page['results']]
+                ))
+            return results_page
+            
+        except Exception as e:
+            self.logger.error(f"Error during search: {e}")
+            return {'results': [], 'total': 0, 'page': page, 'page_count': 0}
+    
     def add_crawl_job(self, name, seed_urls, schedule_type="daily", schedule_time="02:00", 
                       max_pages=100, max_depth=3):
         """Add a scheduled crawl job"""
@@ -133,7 +201,12 @@ class SearchEngine:
     
     def get_index_stats(self):
         """Get search index statistics"""
-        return self.indexer.get_index_stats()
+        cache_key = ('stats', self.indexer.get_generation())
+        stats = self.stats_cache.get(cache_key)
+        if stats is None:
+            stats = self.indexer.get_index_stats()
+            self.stats_cache.set(cache_key, stats)
+        return dict(stats)
     
     def optimize_index(self):
         """Optimize the search index"""
@@ -156,6 +229,7 @@ class SearchEngine:
     def update_ranking_weights(self, weights):
         """Update ranking algorithm weights"""
         self.ranking.update_weights(weights)
+        self.clear_search_cache()
     
     def get_ranking_weights(self):
         """Get current ranking weights"""